@@ -8,6 +8,11 @@ import random  # for generating random numbers and performing random operations
 import os
 import sys
 import warnings
+import hashlib
+import json
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 ################################################################################
 ############################# Path Directories #################################
@@ -22,6 +27,64 @@ def ensure_directory(path):
         print(f"Directory exists: {path}")
 
 
+################################################################################
+############################### Figure Handling ################################
+################################################################################
+
+
+def save_or_show_figure(
+    fig,
+    save_paths,
+    bbox_inches=None,
+    headless=False,
+    close=None,
+):
+    """
+    Save a figure to every path in `save_paths`, then either display it or,
+    in headless mode, close it so it is released from pyplot's registry.
+
+    Parameters:
+    - fig (matplotlib.figure.Figure): The figure to save and show/close.
+    - save_paths (list[str]): Full file paths to save the figure to.
+    - bbox_inches (str, optional): Bounding box passed to `savefig`.
+    - headless (bool, optional): If True, skip `plt.show()`. At least one
+                                 save path is then required.
+    - close (bool, optional): Whether to close the figure afterwards, also
+                              when saving fails. Defaults to `headless`.
+                              Pass False to keep a figure open for reuse.
+
+    Returns:
+    - list[str]: The file paths the figure was saved to.
+
+    Raises:
+    - ValueError: If `headless` is True and `save_paths` is empty, since the
+                  figure would be neither saved nor shown.
+    """
+    if close is None:
+        close = headless
+
+    saved_paths = []
+    try:
+        if headless and not save_paths:
+            raise ValueError(
+                "Headless mode requires an image path and filename to save to."
+            )
+
+        for save_path in save_paths:
+            fig.savefig(save_path, bbox_inches=bbox_inches)
+            saved_paths.append(save_path)
+
+        if not headless:
+            plt.show()
+    finally:
+        # Close even if saving fails, so batch runs that catch per-plot errors
+        # do not accumulate open figures
+        if close:
+            plt.close(fig)
+
+    return saved_paths
+
+
 ################################################################################
 ######################## Generate Random Patient IDs ###########################
 ################################################################################
@@ -170,6 +233,7 @@ def crosstab_plot(
     image_filename=None,
     tight_layout=True,
     bbox_inches=None,
+    headless=False,
 ):
     """
     Generates a series of crosstab plots to visualize the relationship between
@@ -205,6 +269,9 @@ def crosstab_plot(
     - image_path_svg (str): Path to save SVG files.
     - image_filename (str): Base filename for the output image.
     - bbox_inches (str): specify tightness of bbox_inches for visibility.
+    - headless (bool, optional): If True, the figure is saved and closed
+                                 instead of displayed, and the list of saved
+                                 file paths is returned. Use for batch runs.
 
     The function creates a figure with the specified number of subplots laid out
     in a grid, plots the crosstabulation data as bar plots within each subplot,
@@ -272,21 +339,20 @@ def crosstab_plot(
         )
 
     if tight_layout:
-        plt.tight_layout(w_pad=w_pad, h_pad=h_pad)
+        fig.tight_layout(w_pad=w_pad, h_pad=h_pad)
 
     # Save files if paths are provided
+    save_paths = []
     if image_path_png and image_filename:
-        plt.savefig(
-            os.path.join(image_path_png, f"{image_filename}.png"),
-            bbox_inches=bbox_inches,
-        )
+        save_paths.append(os.path.join(image_path_png, f"{image_filename}.png"))
     if image_path_svg and image_filename:
-        plt.savefig(
-            os.path.join(image_path_svg, f"{image_filename}.svg"),
-            bbox_inches=bbox_inches,
-        )
+        save_paths.append(os.path.join(image_path_svg, f"{image_filename}.svg"))
 
-    plt.show()
+    saved_paths = save_or_show_figure(
+        fig, save_paths, bbox_inches=bbox_inches, headless=headless
+    )
+    if headless:
+        return saved_paths
 
 
 ################################################################################
@@ -303,8 +369,9 @@ def create_metrics_boxplots(
     image_path_png,
     image_path_svg,
     save_individual=True,
-    save_grid=True,
+    save_grid=False,
     save_both=False,
+    headless=False,
 ):
     """
     Create and save individual boxplots, an entire grid of boxplots, or both for
@@ -319,8 +386,12 @@ def create_metrics_boxplots(
     - image_path_png: Directory path to save .png images.
     - image_path_svg: Directory path to save .svg images.
     - save_individual: Boolean, True if saving each subplot as an individual file.
-    - save_grid: Boolean, True if saving the entire grid as one image.
+    - save_grid: Boolean, True if saving the entire grid as one image. The grid
+                 is only built when requested, so it defaults to False.
     - save_both: Boolean, True if saving both individual and grid images.
+    - headless: Boolean, True to close the grid figure instead of showing it
+                and return the list of saved file paths. Individual plots
+                share a single reused figure and are never shown.
     """
     # Ensure the directories exist
     os.makedirs(image_path_png, exist_ok=True)
@@ -330,30 +401,37 @@ def create_metrics_boxplots(
         save_individual = True
         save_grid = True
 
+    saved_paths = []
+
     # Save individual plots if required
     if save_individual:
-        for met_comp in metrics_boxplot_comp:
-            for met_list in metrics_list:
-                plt.figure(figsize=(6, 4))  # Adjust the size as needed
-                sns.boxplot(x=df_eda[met_comp], y=df_eda[met_list])
-                plt.title(f"Distribution of {met_list} by {met_comp}")
-                plt.xlabel(met_comp)
-                plt.ylabel(met_list)
-                safe_met_list = (
-                    met_list.replace(" ", "_")
-                    .replace("(", "")
-                    .replace(")", "")
-                    .replace("/", "_per_")
-                )
-                filename_png = f"{safe_met_list}_by_{met_comp}.png"
-                filename_svg = f"{safe_met_list}_by_{met_comp}.svg"
-                plt.savefig(
-                    os.path.join(image_path_png, filename_png), bbox_inches="tight"
-                )
-                plt.savefig(
-                    os.path.join(image_path_svg, filename_svg), bbox_inches="tight"
-                )
-                plt.close()
+        # Every individual plot has the same layout, so one figure/axes pair is
+        # cleared and redrawn rather than allocating a new figure per plot
+        fig, ax = plt.subplots(figsize=(6, 4))  # Adjust the size as needed
+        try:
+            for met_comp in metrics_boxplot_comp:
+                for met_list in metrics_list:
+                    ax.clear()
+                    sns.boxplot(x=df_eda[met_comp], y=df_eda[met_list], ax=ax)
+                    ax.set_title(f"Distribution of {met_list} by {met_comp}")
+                    ax.set_xlabel(met_comp)
+                    ax.set_ylabel(met_list)
+                    safe_met_list = (
+                        met_list.replace(" ", "_")
+                        .replace("(", "")
+                        .replace(")", "")
+                        .replace("/", "_per_")
+                    )
+                    filename_png = f"{safe_met_list}_by_{met_comp}.png"
+                    filename_svg = f"{safe_met_list}_by_{met_comp}.svg"
+                    for save_path in (
+                        os.path.join(image_path_png, filename_png),
+                        os.path.join(image_path_svg, filename_svg),
+                    ):
+                        fig.savefig(save_path, bbox_inches="tight")
+                        saved_paths.append(save_path)
+        finally:
+            plt.close(fig)
 
     # Save the entire grid if required
     if save_grid:
@@ -371,17 +449,20 @@ def create_metrics_boxplots(
             else:
                 ax.set_visible(False)
 
-        plt.tight_layout()
-        fig.savefig(
-            os.path.join(image_path_png, "all_boxplot_comparisons.png"),
+        fig.tight_layout()
+        saved_paths += save_or_show_figure(
+            fig,
+            [
+                os.path.join(image_path_png, "all_boxplot_comparisons.png"),
+                os.path.join(image_path_svg, "all_boxplot_comparisons.svg"),
+            ],
             bbox_inches="tight",
+            headless=headless,
+            close=True,
         )
-        fig.savefig(
-            os.path.join(image_path_svg, "all_boxplot_comparisons.svg"),
-            bbox_inches="tight",
-        )
-        plt.show()  # show the plot(s)
-        plt.close(fig)
+
+    if headless:
+        return saved_paths
 
 
 ################################################################################
@@ -409,6 +490,7 @@ def stacked_plot(
     save_formats=None,
     custom_title=None,
     color=None,
+    headless=False,
 ):
     """
     Generates a pair of stacked bar plots for a specified column against a ground
@@ -444,9 +526,12 @@ def stacked_plot(
       the title constructed from `string` and `truth`.
     - color (list, optional): List of colors to use for the plots. If not provided,
       a default color scheme is used.
+    - headless (bool, optional): If True, the figure is saved and closed instead
+      of displayed. Defaults to False.
 
     Returns:
     - None: The function creates & displays the plots but doesn't return any value.
+      In headless mode, the list of saved file paths is returned instead.
 
     Note:
     - The function assumes the matplotlib and pandas libraries have been
@@ -532,15 +617,19 @@ def stacked_plot(
 
     fig.align_ylabels()
 
+    save_paths = []
     if img_string and save_formats and isinstance(image_path, dict):
         for save_format in save_formats:
             if save_format in image_path:
                 # `save_path` should be the full file path including the
                 # filename, not a directory.
-                full_path = image_path[save_format]
-                plt.savefig(full_path, bbox_inches="tight")
+                save_paths.append(image_path[save_format])
 
-    plt.show()
+    saved_paths = save_or_show_figure(
+        fig, save_paths, bbox_inches="tight", headless=headless
+    )
+    if headless:
+        return saved_paths
 
 
 ################################################################################
@@ -567,6 +656,7 @@ def kde_distributions(
     single_var_image_path_png=None,
     single_var_image_path_svg=None,
     single_var_image_filename=None,
+    headless=False,
 ):
     
     """
@@ -628,14 +718,19 @@ def kde_distributions(
     single_var_image_filename : str, optional
         Filename to use when saving the separate distribution plots. The variable name will be appended to this filename.
 
+    headless : bool, optional (default=False)
+        If True, figures are saved and closed instead of displayed. Image
+        paths and filenames must then be provided for every plot drawn.
+
     Returns:
     --------
-    None
+    None or list of str
+        None, or the list of saved file paths when `headless` is True.
     """
     
     if not dist_list:
         print("Error: No distribution list provided.")
-        return
+        return [] if headless else None
 
     # Calculate the number of columns needed
     # Create subplots grid
@@ -654,42 +749,470 @@ def kde_distributions(
             ax.set_title("\n".join(textwrap.wrap(title, width=text_wrap)))
 
     # Adjust layout with specified padding
-    plt.tight_layout(w_pad=w_pad, h_pad=h_pad)
+    fig.tight_layout(w_pad=w_pad, h_pad=h_pad)
     
     # Save files if paths are provided
+    save_paths = []
     if image_path_png and image_filename:
-        plt.savefig(
-            os.path.join(image_path_png, f"{image_filename}.png"),
-            bbox_inches=bbox_inches,
-        )
+        save_paths.append(os.path.join(image_path_png, f"{image_filename}.png"))
     if image_path_svg and image_filename:
-        plt.savefig(
-            os.path.join(image_path_svg, f"{image_filename}.svg"),
-            bbox_inches=bbox_inches,
-        )
-    plt.show()
+        save_paths.append(os.path.join(image_path_svg, f"{image_filename}.svg"))
+    saved_paths = save_or_show_figure(
+        fig, save_paths, bbox_inches=bbox_inches, headless=headless
+    )
 
     # Generate separate plots for each variable of interest if provided
     if vars_of_interest:
-        for var in vars_of_interest:
-            fig, ax = plt.subplots(figsize=(x, y))
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", UserWarning)
-                title = f"Distribution of {var}"
-                sns.histplot(df[var], kde=kde, ax=ax)
-                ax.set_title("\n".join(textwrap.wrap(title, width=text_wrap)))
-            
-            plt.tight_layout()
-            
-            # Save files for the variable of interest if paths are provided
-            if single_var_image_path_png and single_var_image_filename:
-                plt.savefig(
-                    os.path.join(single_var_image_path_png, f"{single_var_image_filename}_{var}.png"),
-                    bbox_inches=bbox_inches,
-                )
-            if single_var_image_path_svg and single_var_image_filename:
-                plt.savefig(
-                    os.path.join(single_var_image_path_svg, f"{single_var_image_filename}_{var}.svg"),
+        # In headless mode the single-variable plots share one figure that is
+        # cleared between variables and closed once the loop ends or fails.
+        # Otherwise each variable gets its own figure, as displayed figures
+        # may stay open and must not be redrawn.
+        fig = ax = None
+        try:
+            for var in vars_of_interest:
+                if fig is None or not headless:
+                    fig, ax = plt.subplots(figsize=(x, y))
+                else:
+                    ax.clear()
+                    # Undo the previous tight_layout before drawing, since
+                    # seaborn scales bar edges to the axes size at plot time
+                    fig.subplots_adjust(
+                        **{
+                            param: plt.rcParams[f"figure.subplot.{param}"]
+                            for param in ("left", "right", "bottom", "top")
+                        }
+                    )
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UserWarning)
+                    title = f"Distribution of {var}"
+                    sns.histplot(df[var], kde=kde, ax=ax)
+                    ax.set_title("\n".join(textwrap.wrap(title, width=text_wrap)))
+                
+                fig.tight_layout()
+                
+                # Save files for the variable of interest if paths are provided
+                save_paths = []
+                if single_var_image_path_png and single_var_image_filename:
+                    save_paths.append(
+                        os.path.join(single_var_image_path_png, f"{single_var_image_filename}_{var}.png")
+                    )
+                if single_var_image_path_svg and single_var_image_filename:
+                    save_paths.append(
+                        os.path.join(single_var_image_path_svg, f"{single_var_image_filename}_{var}.svg")
+                    )
+                saved_paths += save_or_show_figure(
+                    fig,
+                    save_paths,
                     bbox_inches=bbox_inches,
+                    headless=headless,
+                    close=False,
                 )
-            plt.show()
+        finally:
+            if headless and fig is not None:
+                plt.close(fig)
+
+    if headless:
+        return saved_paths
+
+
+################################################################################
+############################ Derived Table Cache ###############################
+################################################################################
+
+# Cached tables live next to the data so that every notebook shares them
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, "data", "cache"
+)
+DEFAULT_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MB
+CACHE_TMP_GRACE_SECONDS = 60 * 60  # before leftover .tmp files are evicted
+
+
+def data_fingerprint(source, columns=None):
+    """
+    Compute a cheap fingerprint of a data source for use as a cache key.
+
+    For a file path the fingerprint is built from the absolute path, file size
+    and modification time, so the file itself is never read. For a DataFrame
+    it is a hash of the selected columns' values, names and dtypes.
+
+    Parameters:
+    - source (str or pd.DataFrame): Path to a data file, or a DataFrame.
+    - columns (list[str], optional): Columns the derived table depends on.
+                                     Defaults to all columns.
+
+    Returns:
+    - str: A hex digest identifying the state of the source data.
+    """
+    hasher = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        hasher.update(
+            f"{os.path.abspath(source)}|{stat.st_size}|{stat.st_mtime_ns}".encode()
+        )
+    else:
+        data = source[list(columns)] if columns is not None else source
+        hasher.update(repr(list(zip(data.columns, data.dtypes.astype(str)))).encode())
+        hasher.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    hasher.update(repr(None if columns is None else list(columns)).encode())
+    return hasher.hexdigest()
+
+
+def evict_cache(cache_dir=DEFAULT_CACHE_DIR, max_cache_bytes=DEFAULT_CACHE_MAX_BYTES):
+    """
+    Remove least recently used cache files until the cache directory fits
+    within `max_cache_bytes`. Access time is tracked through each file's
+    modification time, which `cached_table` refreshes on every hit. Temporary
+    files left behind by interrupted writes count towards the size too once
+    they are older than `CACHE_TMP_GRACE_SECONDS`; younger ones may still be
+    in use by another process and are left alone.
+
+    Parameters:
+    - cache_dir (str): Directory holding the cached parquet files.
+    - max_cache_bytes (int): Maximum total size of the cache in bytes.
+
+    Returns:
+    - list[str]: Paths of the evicted cache files.
+    """
+    stale_before_ns = time.time_ns() - CACHE_TMP_GRACE_SECONDS * 10**9
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if not entry.is_file():
+            continue
+        stat = entry.stat()
+        if entry.name.endswith(".parquet") or (
+            entry.name.endswith(".tmp") and stat.st_mtime_ns < stale_before_ns
+        ):
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_cache_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # already removed by a concurrent process
+        total_bytes -= size
+        evicted.append(path)
+
+    return evicted
+
+
+def encode_categorical_dtype(dtype):
+    """
+    Describe a categorical dtype (categories and order) as JSON-serializable
+    data, so it can be stored in parquet metadata.
+
+    pyarrow cannot rebuild some categorical labels from parquet, such as the
+    `CategoricalIndex` columns of a crosstab against `age_group` or the
+    interval categories produced by `pd.cut`. `cached_table` stores their
+    integer codes instead and records the dtype with this function.
+
+    Parameters:
+    - dtype (pd.CategoricalDtype): The dtype to encode.
+
+    Returns:
+    - dict: The encoded dtype.
+    """
+    categories = dtype.categories
+    if isinstance(categories, pd.IntervalIndex):
+        encoded_categories = {
+            "kind": "interval",
+            "left": categories.left.tolist(),
+            "right": categories.right.tolist(),
+            "closed": categories.closed,
+        }
+    else:
+        encoded_categories = {
+            "kind": "index",
+            "values": categories.tolist(),
+            "dtype": str(categories.dtype),
+        }
+    return {"categories": encoded_categories, "ordered": bool(dtype.ordered)}
+
+
+def decode_categorical_dtype(encoded):
+    """
+    Rebuild a categorical dtype encoded by `encode_categorical_dtype`.
+
+    Parameters:
+    - encoded (dict): The encoded dtype.
+
+    Returns:
+    - pd.CategoricalDtype: The original dtype.
+    """
+    categories = encoded["categories"]
+    if categories["kind"] == "interval":
+        categories = pd.IntervalIndex.from_arrays(
+            categories["left"], categories["right"], closed=categories["closed"]
+        )
+    else:
+        categories = pd.Index(categories["values"], dtype=categories["dtype"])
+    return pd.CategoricalDtype(categories, ordered=encoded["ordered"])
+
+
+def read_cached_table(cache_path):
+    """
+    Load a table written by `cached_table`, restoring Series results and
+    categorical labels.
+
+    Parameters:
+    - cache_path (str): Path to the cached parquet file.
+
+    Returns:
+    - pd.DataFrame or pd.Series: The cached table.
+    """
+    table = pq.read_table(cache_path)
+    metadata = table.schema.metadata
+    result = table.to_pandas()
+
+    if b"categorical_columns" in metadata:
+        encoded = json.loads(metadata[b"categorical_columns"])
+        result.columns = pd.CategoricalIndex(
+            pd.Categorical.from_codes(
+                encoded["codes"], dtype=decode_categorical_dtype(encoded["dtype"])
+            ),
+            name=encoded["name"],
+        )
+    if b"categorical_levels" in metadata:
+        encoded = json.loads(metadata[b"categorical_levels"])
+        levels = [
+            result.index.get_level_values(level)
+            for level in range(result.index.nlevels)
+        ]
+        for level, encoded_dtype in encoded.items():
+            levels[int(level)] = pd.Categorical.from_codes(
+                levels[int(level)], dtype=decode_categorical_dtype(encoded_dtype)
+            )
+        result.index = pd.MultiIndex.from_arrays(levels, names=result.index.names)
+        if result.index.nlevels == 1:
+            result.index = result.index.get_level_values(0)
+
+    if metadata.get(b"is_series") == b"1":
+        result = result.iloc[:, 0]
+        if metadata.get(b"series_unnamed") == b"1":
+            result.name = None
+    return result
+
+
+def cached_table(
+    func,
+    source,
+    *args,
+    columns=None,
+    name=None,
+    cache_dir=DEFAULT_CACHE_DIR,
+    max_cache_bytes=DEFAULT_CACHE_MAX_BYTES,
+    **kwargs,
+):
+    """
+    Compute a derived table, or load it from the on-disk cache.
+
+    The result of `func(df, *args, **kwargs)` is stored as a parquet file keyed
+    on a fingerprint of the source data (see `data_fingerprint`) plus the
+    operation name and arguments. A later call with an unchanged source and the
+    same arguments loads the stored table instead of recomputing it, without
+    reading the source file. The cache is bounded by size with least recently
+    used eviction.
+
+    Categorical column labels and index levels are stored as codes with their
+    dtype recorded in the file metadata (see `encode_categorical_dtype`), so a
+    loaded table matches the computed one.
+    A table that does not read back equal to what was written is not cached,
+    and an unreadable cache entry is removed and recomputed. The cache never
+    causes a call to fail: if it cannot be written, the result is returned
+    uncached.
+
+    Parameters:
+    - func (callable): Function taking a DataFrame (plus `args`/`kwargs`) and
+                       returning a DataFrame or Series.
+    - source (str or pd.DataFrame): Path to a parquet file, or a DataFrame.
+    - *args: Extra positional arguments passed to `func`.
+    - columns (list[str], optional): Columns `func` depends on. Only these are
+                                     read from a parquet source and hashed for
+                                     a DataFrame source.
+    - name (str, optional): Name identifying the operation in the cache key.
+                            Defaults to `func`'s module and qualified name, and
+                            is required for lambdas.
+    - cache_dir (str, optional): Directory for cached files.
+    - max_cache_bytes (int, optional): Maximum total size of the cache.
+    - **kwargs: Extra keyword arguments passed to `func`.
+
+    Returns:
+    - pd.DataFrame or pd.Series: The derived table.
+
+    Raises:
+    - ValueError: If `func` is a lambda and no `name` is given, since all
+                  lambdas share one qualified name and would collide.
+    """
+    if name is None:
+        if func.__name__ == "<lambda>":
+            raise ValueError("A `name` is required when caching a lambda.")
+        name = f"{func.__module__}.{func.__qualname__}"
+
+    key = hashlib.sha256(
+        "|".join(
+            [
+                data_fingerprint(source, columns=columns),
+                name,
+                repr(args),
+                repr(sorted(kwargs.items())),
+            ]
+        ).encode()
+    ).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{key}.parquet")
+
+    # Cache hit: refresh the access time for LRU eviction and load the table
+    if os.path.exists(cache_path):
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass  # read-only or shared cache; serve without refreshing the LRU
+        try:
+            return read_cached_table(cache_path)
+        except FileNotFoundError:
+            pass  # evicted by a concurrent process; recompute
+        except Exception:
+            # Corrupt or unreadable entry: drop it so it is rebuilt below
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
+    if isinstance(source, (str, os.PathLike)):
+        df = pd.read_parquet(source, columns=columns)
+    else:
+        df = source
+    result = func(df, *args, **kwargs)
+
+    # Write to a temporary file first so readers never see a partial table, and
+    # only keep it if it reads back equal to the computed result
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        # Series are stored as single-column tables and squeezed back on load
+        is_series = isinstance(result, pd.Series)
+        frame = result.to_frame() if is_series else result
+        metadata = {
+            b"is_series": b"1" if is_series else b"0",
+            b"series_unnamed": b"1" if is_series and result.name is None else b"0",
+        }
+        # Categorical labels are stored as codes with their dtype recorded in
+        # the metadata. Relabelling works on a copy, so the caller's result
+        # keeps its categorical labels.
+        if isinstance(frame.columns, pd.CategoricalIndex):
+            metadata[b"categorical_columns"] = json.dumps(
+                {
+                    "dtype": encode_categorical_dtype(frame.columns.dtype),
+                    "codes": frame.columns.codes.tolist(),
+                    "name": frame.columns.name,
+                }
+            ).encode()
+            frame = frame.set_axis(
+                [str(position) for position in range(frame.shape[1])], axis=1
+            )
+        levels = [
+            frame.index.get_level_values(level)
+            for level in range(frame.index.nlevels)
+        ]
+        categorical_levels = {
+            str(level): encode_categorical_dtype(values.dtype)
+            for level, values in enumerate(levels)
+            if isinstance(values, pd.CategoricalIndex)
+        }
+        if categorical_levels:
+            metadata[b"categorical_levels"] = json.dumps(categorical_levels).encode()
+            index = pd.MultiIndex.from_arrays(
+                [
+                    values.codes if str(level) in categorical_levels else values
+                    for level, values in enumerate(levels)
+                ],
+                names=frame.index.names,
+            )
+            if index.nlevels == 1:
+                index = index.get_level_values(0)
+            frame = frame.set_axis(index, axis=0)
+
+        table = pa.Table.from_pandas(frame)
+        table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+        os.makedirs(cache_dir, exist_ok=True)
+        pq.write_table(table, tmp_path)
+        cached = read_cached_table(tmp_path)
+        if is_series:
+            pd.testing.assert_series_equal(cached, result)
+        else:
+            pd.testing.assert_frame_equal(cached, result)
+        os.replace(tmp_path, cache_path)
+    except Exception as error:
+        warnings.warn(f"Not caching {name}: {error}")
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass  # moved into the cache, never written, or already evicted
+
+    try:
+        evict_cache(cache_dir, max_cache_bytes)
+    except OSError:
+        pass  # cache directory missing or read-only
+
+    return result
+
+
+def _crosstab(df, index, columns, normalize):
+    """Crosstab of two columns of `df`, computed by `cached_crosstab`."""
+    return pd.crosstab(df[index], df[columns], normalize=normalize)
+
+
+def cached_crosstab(source, index, columns, normalize=False, **kwargs):
+    """
+    Cached `pd.crosstab` of two columns, e.g. `ETHNICITY` by `SEX`.
+
+    Parameters:
+    - source (str or pd.DataFrame): Path to a parquet file, or a DataFrame.
+    - index (str): Column whose values form the rows of the crosstab.
+    - columns (str): Column whose values form the columns of the crosstab.
+    - normalize (bool or str, optional): Passed through to `pd.crosstab`.
+    - **kwargs: Cache options passed to `cached_table`.
+
+    Returns:
+    - pd.DataFrame: The crosstab.
+    """
+    return cached_table(
+        _crosstab,
+        source,
+        index,
+        columns,
+        normalize,
+        columns=[index, columns],
+        **kwargs,
+    )
+
+
+def _value_counts(df, by, column):
+    """Grouped value counts of `column`, computed by `cached_value_counts`."""
+    return df.groupby(by)[column].value_counts()
+
+
+def cached_value_counts(source, by, column, **kwargs):
+    """
+    Cached `df.groupby(by)[column].value_counts()` summary.
+
+    Parameters:
+    - source (str or pd.DataFrame): Path to a parquet file, or a DataFrame.
+    - by (str or list[str]): Column(s) to group by.
+    - column (str): Column whose values are counted within each group.
+    - **kwargs: Cache options passed to `cached_table`.
+
+    Returns:
+    - pd.Series: Counts indexed by the group keys and the values of `column`.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    return cached_table(
+        _value_counts,
+        source,
+        by,
+        column,
+        columns=by + [column],
+        **kwargs,
+    )